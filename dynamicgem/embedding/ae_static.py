@@ -4,11 +4,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from keras.layers import Input, Subtract
+from keras.layers import Input
 from keras.models import Model, model_from_json
 from keras.optimizers import SGD, Adam
 from keras import backend as KBack
 import tensorflow as tf
+from tensorflow.core.protobuf import rewriter_config_pb2
 from time import time
 import networkx as nx
 
@@ -16,6 +17,28 @@ from dynamicgem.embedding.static_graph_embedding import StaticGraphEmbedding
 from dynamicgem.utils import graph_util
 from dynamicgem.utils.sdne_utils import *
 
+# Static loss scale used when training with mixed precision
+_LOSS_SCALE = 128.0
+
+
+def _new_session(mixed_precision=False):
+    """Create a TF session on a fresh graph for one AE model.
+
+    Each model gets its own graph, so a rebuild never piles new layers
+    into a graph holding older models, and closing the session frees
+    everything the model allocated.
+    """
+    # TensorFlow wizardry
+    config = tf.ConfigProto()
+    # Don't pre-allocate memory; allocate as-needed
+    config.gpu_options.allow_growth = True
+    if mixed_precision:
+        # Let grappler run matmuls in float16 on Tensor Core GPUs while
+        # variables and numerically sensitive ops stay in float32
+        config.graph_options.rewrite_options.auto_mixed_precision = \
+            rewriter_config_pb2.RewriterConfig.ON
+    # Create a session with the above options specified.
+    return tf.Session(graph=tf.Graph(), config=config)
 
 
 class AE(StaticGraphEmbedding):
@@ -37,6 +60,9 @@ class AE(StaticGraphEmbedding):
         n_batch (int): minibatch size for SGD
         modelfile (str): Files containing previous encoder and decoder models
         weightfile (str): Files containing previous encoder and decoder weights
+        mixed_precision (bool): train with float16 matmuls on supported GPUs. A static
+            loss scale of 128 is applied (the reported loss is scaled too); there is no
+            dynamic loss scaling, so training can still overflow, diverge or stall.
     
     Examples:
         >>> from dynamicgem.embedding.ae_static import AE
@@ -79,8 +105,8 @@ class AE(StaticGraphEmbedding):
             'actfn': 'relu',
             'modelfile': None,
             'weightfile': None,
-            'savefilesuffix': None
-
+            'savefilesuffix': None,
+            'mixed_precision': False
         }
         hyper_params.update(kwargs)
         for key in hyper_params.keys():
@@ -116,100 +142,122 @@ class AE(StaticGraphEmbedding):
                 List: Node embeddings and time taken by the algorithm
         """
 
-        # TensorFlow wizardry
-        config = tf.ConfigProto()
-        # Don't pre-allocate memory; allocate as-needed
-        config.gpu_options.allow_growth = True
-        # Only allow a total of half the GPU memory to be allocated
-        config.gpu_options.per_process_gpu_memory_fraction = 0.1
-        # Create a session with the above options specified.
-        KBack.tensorflow_backend.set_session(tf.Session(config=config))
-
         if not graph and not edge_f:
             raise Exception('graph/edge_f needed')
         if not graph:
             graph = graph_util.loadGraphFromEdgeListTxt(edge_f)
 
-        S = nx.to_scipy_sparse_matrix(graph)
+        S = nx.to_scipy_sparse_matrix(graph, format='csr')
+        S.eliminate_zeros()
+        # Cache the CSR arrays once; the batch generator only slices them.
+        # The penalty matrix B (beta on edges, -2 elsewhere) is never built
+        # in full, since a dense B is O(n^2): its rows for each batch are
+        # scattered from these same arrays together with the rows of S.
+        nbr_data, nbr_idx, nbr_ptr = S.data, S.indices, S.indptr
         self._node_num = graph.number_of_nodes()
         t1 = time()
 
-        # Generate encoder, decoder and autoencoder
         self._num_iter = self._n_iter
-        self._encoder = get_encoder(self._node_num, self._d,
-                                    self._n_units,
-                                    self._nu1, self._nu2,
-                                    self._actfn)
-        self._decoder = get_decoder(self._node_num, self._d,
-                                    self._n_units,
-                                    self._nu1, self._nu2,
-                                    self._actfn)
-        self._autoencoder = get_autoencoder(self._encoder, self._decoder)
-
-        # Initialize self._model
-        # Input
-        x_in = Input(shape=(self._node_num,), name='x_in')
-        # Process inputs
-        [x_hat, y] = self._autoencoder(x_in)
-        # Outputs
-        x_diff = Subtract()([x_hat, x_in])
-
-        # Objectives
-        def weighted_mse_x(y_true, y_pred):
-            """ Hack: This fn doesn't accept additional arguments.
-                      We use y_true to pass them.
-                y_pred: Contains x_hat - x
-                y_true: Contains b
-            """
-            return KBack.sum(
-                KBack.square(y_pred * y_true[:, 0:self._node_num]),
-                axis=-1
+        reuse = (getattr(self, '_model_node_num', None) == self._node_num
+                 and self._model_mixed_precision == self._mixed_precision)
+        if not reuse:
+            # New architecture: drop the previous model's graph and session
+            if getattr(self, '_tf_session', None) is not None:
+                self._tf_session.close()
+                self._model_node_num = None
+            self._tf_session = _new_session(self._mixed_precision)
+        with self._tf_session.graph.as_default(), self._tf_session.as_default():
+            if reuse:
+                # Same architecture, graph and session: only redraw the weights
+                # and reset the optimizer state. The optimizer creates its slots
+                # on the first fit, so the initializer is built once after that.
+                if self._reinit_op is None:
+                    self._reinit_op = tf.variables_initializer(
+                        self._model.weights + self._model.optimizer.weights)
+                self._tf_session.run(self._reinit_op)
+            else:
+                # With mixed precision the whole training loss, regularizers
+                # included, is multiplied by a static scale and the step size
+                # divided by it. SGD updates are unchanged, but float16 gradients
+                # don't underflow. The layers keep the real nu1/nu2, so saved
+                # models are unaffected.
+                loss_scale = _LOSS_SCALE if self._mixed_precision else 1.0
+                # Generate encoder, decoder and autoencoder
+                self._encoder = get_encoder(self._node_num, self._d,
+                                            self._n_units,
+                                            self._nu1, self._nu2,
+                                            self._actfn)
+                self._decoder = get_decoder(self._node_num, self._d,
+                                            self._n_units,
+                                            self._nu1, self._nu2,
+                                            self._actfn)
+                self._autoencoder = get_autoencoder(self._encoder, self._decoder)
+
+                # Initialize self._model
+                # Inputs: adjacency rows and their penalty rows B
+                x_in = Input(shape=(self._node_num,), name='x_in')
+                b_in = Input(shape=(self._node_num,), name='b_in')
+                # Process inputs
+                [x_hat, y] = self._autoencoder(x_in)
+
+                # Objective: weighted reconstruction error ||(x_hat - x) * b||^2,
+                # computed directly in the loss instead of through a Subtract layer
+                weighted_mse_x = KBack.mean(KBack.sum(
+                    KBack.square((x_hat - x_in) * b_in),
+                    axis=-1
+                ))
+
+                # Model
+                self._model = Model(input=[x_in, b_in], output=x_hat)
+                self._model.add_loss(loss_scale * weighted_mse_x)
+                if loss_scale != 1.0 and self._autoencoder.losses:
+                    # Keras already adds the layer regularizers once, unscaled
+                    self._model.add_loss((loss_scale - 1.0) * sum(self._autoencoder.losses))
+                sgd = SGD(lr=self._xeta / loss_scale, decay=1e-5, momentum=0.99, nesterov=True)
+                adam = Adam(lr=self._xeta, beta_1=0.9, beta_2=0.999, epsilon=1e-08)
+                self._model.compile(optimizer=sgd, loss=None)
+                self._model_node_num = self._node_num
+                self._model_mixed_precision = self._mixed_precision
+                self._reinit_op = None
+
+            history = self._model.fit_generator(
+                generator=batch_generator_ae(nbr_data, nbr_idx, nbr_ptr, self._beta, self._n_batch, True),
+                epochs=self._num_iter,
+                steps_per_epoch=S.shape[0] // self._n_batch,
+                verbose=1,
+                # callbacks=[tensorboard]
+                # callbacks=[callbacks.TerminateOnNaN()]
             )
-
-        # Model
-        self._model = Model(input=x_in, output=x_diff)
-        sgd = SGD(lr=self._xeta, decay=1e-5, momentum=0.99, nesterov=True)
-        adam = Adam(lr=self._xeta, beta_1=0.9, beta_2=0.999, epsilon=1e-08)
-        self._model.compile(optimizer=sgd, loss=weighted_mse_x)
-
-        history = self._model.fit_generator(
-            generator=batch_generator_ae(S, self._beta, self._n_batch, True),
-            nb_epoch=self._num_iter,
-            samples_per_epoch=S.shape[0] // self._n_batch,
-            verbose=1,
-            # callbacks=[tensorboard]
-            # callbacks=[callbacks.TerminateOnNaN()]
-        )
-        loss = history.history['loss']
-        # Get embedding for all points
-        if loss[0] == np.inf or np.isnan(loss[0]):
-            print('Model diverged. Assigning random embeddings')
-            self._Y = np.random.randn(self._node_num, self._d)
-        else:
-            try:
-                self._Y, self._next_adj = model_batch_predictor_v2(self._autoencoder, S, self._n_batch)
-            except:
-                pdb.set_trace()
-        t2 = time()
-        # Save the autoencoder and its weights
-        if self._weightfile is not None:
-            saveweights(self._encoder, self._weightfile[0])
-            saveweights(self._decoder, self._weightfile[1])
-        if self._modelfile is not None:
-            savemodel(self._encoder, self._modelfile[0])
-            savemodel(self._decoder, self._modelfile[1])
-        if self._savefilesuffix is not None:
-            saveweights(self._encoder,
-                        'encoder_weights_' + self._savefilesuffix + '.hdf5')
-            saveweights(self._decoder,
-                        'decoder_weights_' + self._savefilesuffix + '.hdf5')
-            savemodel(self._encoder,
-                      'encoder_model_' + self._savefilesuffix + '.json')
-            savemodel(self._decoder,
-                      'decoder_model_' + self._savefilesuffix + '.json')
-            # Save the embedding
-            np.savetxt('embedding_' + self._savefilesuffix + '.txt',
-                       self._Y)
+            loss = history.history['loss']
+            # Get embedding for all points
+            if loss[0] == np.inf or np.isnan(loss[0]):
+                print('Model diverged. Assigning random embeddings')
+                self._Y = np.random.randn(self._node_num, self._d)
+            else:
+                try:
+                    self._Y, self._next_adj = model_batch_predictor_v2(self._autoencoder, S, self._n_batch)
+                except:
+                    pdb.set_trace()
+            t2 = time()
+            # Save the autoencoder and its weights
+            if self._weightfile is not None:
+                saveweights(self._encoder, self._weightfile[0])
+                saveweights(self._decoder, self._weightfile[1])
+            if self._modelfile is not None:
+                savemodel(self._encoder, self._modelfile[0])
+                savemodel(self._decoder, self._modelfile[1])
+            if self._savefilesuffix is not None:
+                saveweights(self._encoder,
+                            'encoder_weights_' + self._savefilesuffix + '.hdf5')
+                saveweights(self._decoder,
+                            'decoder_weights_' + self._savefilesuffix + '.hdf5')
+                savemodel(self._encoder,
+                          'encoder_model_' + self._savefilesuffix + '.json')
+                savemodel(self._decoder,
+                          'decoder_model_' + self._savefilesuffix + '.json')
+                # Save the embedding
+                np.savetxt('embedding_' + self._savefilesuffix + '.txt',
+                           self._Y)
         return self._Y, (t2 - t1)
 
     def get_embedding(self, filesuffix=None):
@@ -237,16 +285,34 @@ class AE(StaticGraphEmbedding):
             Returns:
                 Float: Weight of the given edge.
         """
+        return self.get_edge_weights([(i, j)], embed, filesuffix)[0]
+
+    def get_edge_weights(self, pairs, embed=None, filesuffix=None):
+        """Function to get the weights of many edges with one decoder pass.
+           
+            Attributes:
+              pairs (list): (source, target) node pairs.
+              embed (Matrix): Embedding values of all the nodes.
+              filesuffix (str): File suffix to be used to load the embedding.
+
+            Returns:
+                Vector: Weight of each of the given edges.
+        """
         if embed is None:
             if filesuffix is None:
                 embed = self._Y
             else:
                 embed = np.loadtxt('embedding_' + filesuffix + '.txt')
-        if i == j:
-            return 0
-        else:
-            S_hat = self.get_reconst_from_embed(embed[(i, j), :], filesuffix)
-            return (S_hat[i, j] + S_hat[j, i]) / 2
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        if pairs.shape[0] == 0:
+            return np.zeros(0)
+        # Decode every distinct endpoint once, then gather both directions
+        nodes, inv = np.unique(pairs, return_inverse=True)
+        inv = inv.reshape(pairs.shape)
+        S_hat = self.get_reconst_from_embed(embed[nodes, :], filesuffix=filesuffix)
+        weights = (S_hat[inv[:, 0], pairs[:, 1]] + S_hat[inv[:, 1], pairs[:, 0]]) / 2
+        weights[pairs[:, 0] == pairs[:, 1]] = 0
+        return weights
 
     def get_reconstructed_adj(self, embed=None, node_l=None, filesuffix=None):
         """Function to reconstruct the adjacency list for the given node.
@@ -280,13 +346,14 @@ class AE(StaticGraphEmbedding):
                 List: REconstructed graph for the given nodes.
         """
         if filesuffix is None:
-            if node_l is not None:
-                return self._decoder.predict(
-                    embed,
-                    batch_size=self._n_batch
-                )[:, node_l]
-            else:
-                return self._decoder.predict(embed, batch_size=self._n_batch)
+            with self._tf_session.graph.as_default(), self._tf_session.as_default():
+                if node_l is not None:
+                    return self._decoder.predict(
+                        embed,
+                        batch_size=self._n_batch
+                    )[:, node_l]
+                else:
+                    return self._decoder.predict(embed, batch_size=self._n_batch)
         else:
             try:
                 decoder = model_from_json(
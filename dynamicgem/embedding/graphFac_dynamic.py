@@ -5,6 +5,8 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
+from scipy import sparse
+from scipy.linalg import solve
 
 from dynamicgem.embedding.dynamic_graph_embedding import DynamicGraphEmbedding
 from dynamicgem.utils import graph_util
@@ -12,6 +14,35 @@ from dynamicgem.utils import plot_util
 from dynamicgem.visualization import plot_dynamic_sbm_embedding
 from dynamicgem.graph_generation import dynamic_SBM_graph
 
+try:
+    from numba import njit, prange
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+if _HAS_NUMBA:
+    @njit(parallel=True, cache=True, fastmath=True)
+    def _gf_sgd_step(X, I, J, V, eta, regu, kappa, prevEmbed, n_prev):
+        """One SGD pass over the edges (I[k], J[k]) with weights V[k].
+
+        Edges are processed in parallel, Hogwild style: rows of X are
+        updated in place without locking, so two threads touching the
+        same row may race. Such collisions are rare for sparse graphs and
+        do not hurt convergence in practice; callers should shuffle the
+        edges so neighbouring threads work on different rows. Rows below
+        n_prev are pulled towards prevEmbed with strength kappa.
+        """
+        d_emb = X.shape[1]
+        for k in prange(I.size):
+            i = I[k]
+            j = J[k]
+            resid = V[k] - np.dot(X[i], X[j])
+            for t in range(d_emb):
+                g = -resid * X[j, t] + regu * X[i, t]
+                if i < n_prev:
+                    g += kappa * (X[i, t] - prevEmbed[i, t])
+                X[i, t] -= eta * g
+
 
 class GraphFactorization(DynamicGraphEmbedding):
     """Graph Facgorization based network embedding
@@ -73,10 +104,26 @@ class GraphFactorization(DynamicGraphEmbedding):
         """
         return '%s_%d' % (self._method_name, self._d)
 
-    def getFVal(self, adj_mtx, X, prev_step_emb=None):
-        """Function to Factorize the adjacency matrix."""
-        f1 = np.linalg.norm(adj_mtx - np.dot(X, X.T)) ** 2
-        f2 = self._regu * (np.linalg.norm(X) ** 2)
+    def getFVal(self, adj_mtx, X, prev_step_emb=None, adj_fro2=None):
+        """Function to Factorize the adjacency matrix.
+
+        The reconstruction term uses the identity
+        ||A - XX^T||_F^2 = ||A||_F^2 - 2 tr(X^T A X) + ||X^T X||_F^2
+        so that the dense n x n product XX^T is never formed. adj_mtx
+        may be a dense array or a scipy sparse matrix, and adj_fro2 can
+        be passed to reuse a precomputed ||A||_F^2.
+        """
+        if adj_fro2 is None:
+            if sparse.issparse(adj_mtx):
+                adj_fro2 = adj_mtx.multiply(adj_mtx).sum()
+            else:
+                adj_fro2 = np.sum(adj_mtx * adj_mtx)
+        # O(E d + n d^2): one sparse product and one d x d Gram matrix
+        AX = adj_mtx.dot(X)
+        XtX = np.dot(X.T, X)
+        f1 = adj_fro2 - 2 * np.einsum('ij,ij->', X, AX) + np.einsum('ij,ij->', XtX, XtX)
+        # ||X||_F^2 is the trace of the Gram matrix
+        f2 = self._regu * np.trace(XtX)
         f3 = 0
         if prev_step_emb is not None:
             f3 = self._kappa * (
@@ -94,43 +141,66 @@ class GraphFactorization(DynamicGraphEmbedding):
                 List: Node embeddings and time taken by the algorithm
         """
         # pdb.set_trace()
-        A = graph_util.transform_DiGraph_to_adj(graph)
-        if not np.allclose(A.T, A):
+        n = graph.number_of_nodes()
+        # Same (st, ed, w) triples as graph_util.transform_DiGraph_to_adj, kept sparse
+        edges = np.array(list(graph.edges(data='weight', default=1)), dtype=np.float64).reshape(-1, 3)
+        A = sparse.csr_matrix((edges[:, 2].astype(np.float32),
+                               (edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64))), shape=(n, n))
+        if (A - A.T).nnz != 0:
             print("laplace eigmap approach only works for symmetric graphs!")
             return
 
         self._node_num = A.shape[0]
-        edgeList = np.where(A > 0)
+        A_coo = A.tocoo()
+        upper = (A_coo.row < A_coo.col) & (A_coo.data > 0)
+        I, J, A_IJ = A_coo.row[upper], A_coo.col[upper], A_coo.data[upper]
+        edge_order = np.lexsort((J, I))
+        I, J, A_IJ = I[edge_order], J[edge_order], A_IJ[edge_order]
+        # Rounds of at most one edge per source row: round r holds the r-th
+        # edge of every row, so each row takes one bounded step per round
+        rank = np.arange(I.size) - np.searchsorted(I, I)
+        rounds = np.split(np.argsort(rank, kind='stable'), np.cumsum(np.bincount(rank))[:-1])
+        A_fro2 = np.sum(A.data * A.data)
         self._num_iter = self._n_iter
-        self._X = 0.01 * np.random.randn(self._node_num, self._d)
+        self._X = (0.01 * np.random.randn(self._node_num, self._d)).astype(np.float32, copy=False)
         if prevEmbed is not None:
+            prevEmbed = prevEmbed.astype(np.float32, copy=False)
             print('Initializing X_t with X_t-1')
             # self._X = 0.01*np.random.randn(self._node_num, self._d)
             self._X[:prevEmbed.shape[0], :] = np.copy(prevEmbed)
             self._num_iter = self._n_iter_sub
+            prev_arr, n_prev = prevEmbed, prevEmbed.shape[0]
+        else:
+            prev_arr, n_prev = np.zeros((0, self._d), dtype=np.float32), 0
         # pdb.set_trace()
 
         for iter_id in range(self._num_iter):
             if not iter_id % 100:
-                [f1, f2, f3, f] = self.getFVal(A, self._X, prevEmbed)
+                [f1, f2, f3, f] = self.getFVal(A, self._X, prevEmbed, A_fro2)
                 print('Iter: %d, Objective value: %g, f1: %g, f2: %g, f3: %g' % (iter_id, f, f1, f2, f3))
 
-            for i, j in zip(edgeList[0], edgeList[1]):
-                if i >= j:
-                    continue
-                delPhi1 = -(A[i, j] - np.dot(self._X[i, :], self._X[j, :])) * self._X[j, :]
-                delPhi2 = self._regu * self._X[i, :]
-                delPhi3 = np.zeros(self._d)
-                if prevEmbed is not None and i < prevEmbed.shape[0]:
-                    delPhi3 = self._kappa * (self._X[i, :] - prevEmbed[i, :])
-                delPhi = delPhi1 + delPhi2 + delPhi3
-                self._X[i, :] -= self._eta * delPhi
-            # if prevEmbed is not None:
-            # 	print '(i, j) = (%d, %d)' % (i, j)
-
-            if not iter_id % 100:
-                print('Iter: %d, Del values: %g, del_f1: %g, del_f2: %g, del_f3: %g' % (
-                    iter_id, delPhi[0], delPhi1[0], delPhi2[0], delPhi3[0]))
+            if _HAS_NUMBA:
+                perm = np.random.permutation(I.size)
+                _gf_sgd_step(self._X, I[perm], J[perm], A_IJ[perm], self._eta, self._regu, self._kappa,
+                             prev_arr, n_prev)
+            else:
+                # Same updates as a sequential pass over the edges (i, j), i < j:
+                # row i moves once per edge, and rows j > i are read as they
+                # were at the start of the pass
+                X_start = np.copy(self._X)
+                for idx in rounds:
+                    I_r, J_r = I[idx], J[idx]
+                    X_I = self._X[I_r]
+                    X_J = X_start[J_r]
+                    resid = A_IJ[idx] - np.einsum('ij,ij->i', X_I, X_J)
+                    delPhi1 = -resid[:, None] * X_J
+                    delPhi2 = self._regu * X_I
+                    delPhi3 = np.zeros_like(X_I)
+                    if prevEmbed is not None:
+                        in_prev = I_r < n_prev
+                        delPhi3[in_prev] = self._kappa * (X_I[in_prev] - prevEmbed[I_r[in_prev]])
+                    delPhi = delPhi1 + delPhi2 + delPhi3
+                    self._X[I_r] -= self._eta * delPhi
 
         return self._X
 
@@ -140,19 +210,21 @@ class GraphFactorization(DynamicGraphEmbedding):
 			graphs: the graphs to embed in networkx DiGraph format
 		"""
         self._kappas = self._kappa
+        X_curr = graph_util.transform_DiGraph_to_adj(graphs[0])
         if prevStepInfo:
             self._Xs = [np.copy(self.learn_embedding(graphs[0], self._initEmbed))]
         else:
             self._Xs = [np.copy(self.learn_embedding(graphs[0]))]
         for i in range(1, len(graphs)):
             # pdb.set_trace()
+            # Each graph is converted once; only two adjacencies are kept alive
+            X_prev = X_curr
             X_curr = graph_util.transform_DiGraph_to_adj(graphs[i])
-            X_prev = graph_util.transform_DiGraph_to_adj(graphs[i - 1])
             delX = abs(X_curr - X_prev)
             beta = 0.01
             M_g = np.eye(X_curr.shape[0]) - beta * delX
             M_l = beta * delX  # np.dot(delX, delX)#
-            S = np.dot(np.linalg.inv(M_g), M_l)
+            S = solve(M_g, M_l, assume_a='gen', overwrite_a=True, overwrite_b=False)
             S_sum = np.sum(S, 1)
             S_sum[S_sum == 0] = 0.01
             self._kappas = self._kappa / S_sum
@@ -197,10 +269,6 @@ class GraphFactorization(DynamicGraphEmbedding):
         if X is not None:
             self._X = X
             self._node_num = X.shape[0]
-        adj_mtx_r = np.zeros((self._node_num, self._node_num))  # G_r is the reconstructed graph
-        for v_i in range(self._node_num):
-            for v_j in range(self._node_num):
-                if v_i == v_j:
-                    continue
-                adj_mtx_r[v_i, v_j] = self.get_edge_weight(v_i, v_j)
+        adj_mtx_r = np.dot(self._X, self._X.T)  # G_r is the reconstructed graph
+        np.fill_diagonal(adj_mtx_r, 0)
         return adj_mtx_r
@@ -1,7 +1,16 @@
 import numpy as np
+from scipy import sparse
 import pdb
 
 precision_pos = [2, 10, 100, 200, 300, 500, 1000]
+_PREC_POS = tuple(precision_pos)
+
+
+def _edge_lookup(true_digraph):
+    """Function to get a CSR matrix with a 1 for every edge of the graph"""
+    n = true_digraph.number_of_nodes()
+    edges = np.array(list(true_digraph.edges()), dtype=np.int64).reshape(-1, 2)
+    return sparse.csr_matrix((np.ones(edges.shape[0]), (edges[:, 0], edges[:, 1])), shape=(n, n))
 
 
 def computePrecisionCurve(predicted_edge_list, true_digraph, max_k=-1):
@@ -51,46 +60,32 @@ def computeMAP(predicted_edge_list, true_digraph, max_k=-1):
     for i in range(node_num):
         node_edges.append([])
     for (st, ed, w) in predicted_edge_list:
-        node_edges[st].append((st, ed, w))
+        node_edges[st].append((ed, w))
+    true_adj = _edge_lookup(true_digraph)
     node_AP = [0.0] * node_num
     count = 0
     for i in range(node_num):
         if true_digraph.out_degree(i) == 0:
             continue
         count += 1
-        precision_scores, delta_factors = computePrecisionCurve(node_edges[i], true_digraph, max_k)
-        precision_rectified = [p * d for p, d in zip(precision_scores, delta_factors)]
-        if (sum(delta_factors) == 0):
+        if not node_edges[i]:
+            continue
+        dst, w = zip(*node_edges[i])
+        # Stable sort keeps ties in input order, matching computePrecisionCurve
+        order = np.argsort(-np.asarray(w, dtype=np.float64), kind='stable')
+        if max_k != -1:
+            order = order[:max_k]
+        dst = np.asarray(dst)[order]
+        hits = (np.asarray(true_adj[np.full(len(dst), i), dst]).ravel() != 0).astype(np.float64)
+        hit_num = hits.sum()
+        if hit_num == 0:
             node_AP[i] = 0
         else:
-            node_AP[i] = float(sum(precision_rectified) / sum(delta_factors))
+            precision_scores = np.cumsum(hits) / np.arange(1, len(hits) + 1)
+            node_AP[i] = float(np.sum(precision_scores * hits) / hit_num)
     return sum(node_AP) / count
 
 
-def checkedges(edge_list, e):
-    """Function to check if the given edgelist matches.
-           
-           Attributes:
-               edge_list (list): List of predicted edges.
-               e (list): Original edge list
-
-            Returns:
-                bool: Boolean result to denoe if all the edges matches.
-    """
-    val = False
-
-    for k in edge_list:
-        if type(e) is tuple:
-            if k[1] == e[1] and k[0] == e[0]:
-                val = True
-        else:
-            for ee in e:
-                if k[1] == ee[1] and k[0] == ee[0]:
-                    val = True
-
-    return val
-
-
 def getMetricsHeader():
     """Function to get the header for storing the result"""
     header = 'MAP\t' + '\t'.join(['P@%d' % p for p in precision_pos])
@@ -100,14 +95,9 @@ def getMetricsHeader():
 
 def getPrecisionReport(prec_curv, edge_num):
     """Function to get the report summary for precision"""
-    result_str = ''
-    temp_pos = precision_pos[:] + [edge_num]
-    for p in temp_pos:
-        if (p < len(prec_curv)):
-            result_str += '\t%f' % prec_curv[p - 1]
-        else:
-            result_str += '\t-'
-    return result_str[1:]
+    curv_len = len(prec_curv)
+    return '\t'.join('%f' % prec_curv[p - 1] if p < curv_len else '-'
+                     for p in _PREC_POS + (edge_num,))
 
 
 # We define StabilityDeviation of nxd embeddings X1 and X2,
@@ -128,15 +118,16 @@ def getEmbeddingShift(X1, X2, S1, S2):
 
 def getNodeAnomaly(X_dyn):
     """Function to get the node anomaly"""
-    T = len(X_dyn)
-    n_nodes = X_dyn[0].shape[0]
-    node_anom = np.zeros((n_nodes, T - 1))
-    for t in range(T - 1):
-        node_anom[:, t] = np.linalg.norm(X_dyn[t + 1][:n_nodes, :] - X_dyn[t][:n_nodes, :], axis=1)
-    return node_anom
+    n_nodes, d = X_dyn[0].shape
+    # Fill a single float32 buffer so no float64 copy of the stack is made
+    X_stack = np.empty((len(X_dyn), n_nodes, d), dtype=np.float32)
+    for t, X in enumerate(X_dyn):
+        X_stack[t] = X[:n_nodes, :]
+    return np.linalg.norm(X_stack[1:] - X_stack[:-1], axis=2).T
 
 
-def computePrecisionCurve_changed(predicted_edge_list, true_digraph, node_edges_rm, max_k=-1):
+def computePrecisionCurve_changed(predicted_edge_list, true_digraph, node_edges_rm, max_k=-1, pred_edge_set=None,
+                                  true_adj=None):
     """Function to calculate Preicison curve of changed graph
            
            Attributes:
@@ -144,6 +135,8 @@ def computePrecisionCurve_changed(predicted_edge_list, true_digraph, node_edges_
                true_digraph (object): original graph
                node_edges_rm (list): list of edges removed from the original graph.
                max_k(int): precision@k
+               pred_edge_set (set): (st, ed) pairs of predicted_edge_list, built here if not given.
+               true_adj (csr_matrix): edge indicator of true_digraph, built here if not given.
 
             Returns:
                 Float: Mean Average Precision score
@@ -153,23 +146,26 @@ def computePrecisionCurve_changed(predicted_edge_list, true_digraph, node_edges_
     else:
         max_k = min(max_k, len(predicted_edge_list) + len(node_edges_rm))
 
-    sorted_edges = sorted(predicted_edge_list, key=lambda x: x[2], reverse=True)
-
     precision_scores = []
     delta_factors = []
     correct_edge = 0
-    for i in range(len(predicted_edge_list)):
-        if true_digraph.has_edge(sorted_edges[i][0], sorted_edges[i][1]):
-            correct_edge += 1
-            delta_factors.append(1.0)
-        else:
-            delta_factors.append(0.0)
-        precision_scores.append(1.0 * correct_edge / (i + 1))
+    if predicted_edge_list:
+        if true_adj is None:
+            true_adj = _edge_lookup(true_digraph)
+        st, ed, w = zip(*predicted_edge_list)
+        # Stable sort keeps ties in input order
+        order = np.argsort(-np.asarray(w, dtype=np.float64), kind='stable')
+        hits = (np.asarray(true_adj[np.asarray(st)[order], np.asarray(ed)[order]]).ravel() != 0).astype(np.float64)
+        correct_edge = int(hits.sum())
+        delta_factors = hits.tolist()
+        precision_scores = (np.cumsum(hits) / np.arange(1, len(hits) + 1)).tolist()
 
     # pdb.set_trace()
     if node_edges_rm:
+        if pred_edge_set is None:
+            pred_edge_set = {(st, ed) for st, ed, _ in predicted_edge_list}
         for j in range(len(node_edges_rm)):
-            if not checkedges(predicted_edge_list, node_edges_rm[j]):
+            if (node_edges_rm[j][0], node_edges_rm[j][1]) not in pred_edge_set:
                 correct_edge += 1
                 delta_factors.append(1.0)
             else:
@@ -205,6 +201,7 @@ def computeMAP_changed(predicted_edge_list, true_digraph, node_dict, edges_rm, m
         node_edges_rm.append([])
     for st, ed in edges_rm[0]:
         node_edges_rm[node_dict[st]].append((node_dict[st], node_dict[ed], 1))
+    true_adj = _edge_lookup(true_digraph)
 
         # pdb.set_trace()
     node_AP = [0.0] * node_num
@@ -213,8 +210,9 @@ def computeMAP_changed(predicted_edge_list, true_digraph, node_dict, edges_rm, m
         if true_digraph.out_degree(i) == 0:
             continue
         count += 1
+        pred_edge_set = {(st, ed) for st, ed, _ in node_edges[i]}
         precision_scores, delta_factors = computePrecisionCurve_changed(node_edges[i], true_digraph, node_edges_rm[i],
-                                                                        max_k)
+                                                                        max_k, pred_edge_set, true_adj)
         precision_rectified = [p * d for p, d in zip(precision_scores, delta_factors)]
         if (sum(delta_factors) == 0):
             node_AP[i] = 0
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This module is for testing graphFac_dynamic
+"""
+
+import numpy as np
+import networkx as nx
+import pytest
+from dynamicgem.embedding import graphFac_dynamic
+from dynamicgem.embedding.graphFac_dynamic import GraphFactorization
+from dynamicgem.utils import graph_util
+
+
+def sbm_graph(seed):
+    # Two communities of 20 nodes each
+    graph = nx.stochastic_block_model([20, 20], [[0.4, 0.05], [0.05, 0.4]], seed=seed)
+    return nx.DiGraph(graph.to_directed())
+
+
+@pytest.mark.parametrize('use_numba', [False, True])
+def test_graphFac_objective_decreases(monkeypatch, use_numba):
+    if use_numba:
+        pytest.importorskip('numba')
+    monkeypatch.setattr(graphFac_dynamic, '_HAS_NUMBA', use_numba)
+    node_num = 40
+    dim_emb = 4
+    embedding = GraphFactorization(dim_emb, 300, 300, 1e-3, 1e-2, 1e-1)
+    graph_1 = sbm_graph(1)
+    graph_2 = sbm_graph(2)
+    adj_1 = graph_util.transform_DiGraph_to_adj(graph_1)
+    adj_2 = graph_util.transform_DiGraph_to_adj(graph_2)
+
+    # Same random initialization as learn_embedding
+    np.random.seed(0)
+    X_init = (0.01 * np.random.randn(node_num, dim_emb)).astype(np.float32)
+    np.random.seed(0)
+    X_1 = np.copy(embedding.learn_embedding(graph_1))
+    assert X_1.shape == (node_num, dim_emb)
+    assert embedding.getFVal(adj_1, X_1)[3] < embedding.getFVal(adj_1, X_init)[3]
+
+    # The second step starts from the first embedding
+    X_2 = embedding.learn_embedding(graph_2, X_1)
+    assert embedding.getFVal(adj_2, X_2, X_1)[3] < embedding.getFVal(adj_2, X_1, X_1)[3]
+
+
+def sequential_sgd(X, adj, eta, regu, kappa, n_iter, prevEmbed=None):
+    # Per-edge SGD loop of the original GraphFactorization implementation
+    X = np.copy(X).astype(np.float64)
+    edgeList = np.where(adj > 0)
+    for iter_id in range(n_iter):
+        for i, j in zip(edgeList[0], edgeList[1]):
+            if i >= j:
+                continue
+            delPhi = -(adj[i, j] - np.dot(X[i, :], X[j, :])) * X[j, :] + regu * X[i, :]
+            if prevEmbed is not None and i < prevEmbed.shape[0]:
+                delPhi += kappa * (X[i, :] - prevEmbed[i, :])
+            X[i, :] -= eta * delPhi
+    return X
+
+
+@pytest.mark.parametrize('use_numba', [False, True])
+def test_graphFac_matches_sequential_sgd(monkeypatch, use_numba):
+    if use_numba:
+        pytest.importorskip('numba')
+    monkeypatch.setattr(graphFac_dynamic, '_HAS_NUMBA', use_numba)
+    # Example hyperparameters from the GraphFactorization docstring on a
+    # graph whose nodes have degree well above 20
+    node_num = 200
+    dim_emb = 16
+    eta, regu, kappa = 5e-2, 1.0, 1.0
+    embedding = GraphFactorization(dim_emb, 10, 10, eta, regu, kappa)
+    graphs = [nx.DiGraph(nx.stochastic_block_model([100, 100], [[0.4, 0.05], [0.05, 0.4]],
+                                                    seed=seed).to_directed()) for seed in range(2)]
+    adj_1 = graph_util.transform_DiGraph_to_adj(graphs[0])
+    adj_2 = graph_util.transform_DiGraph_to_adj(graphs[1])
+    assert min(d for _, d in graphs[0].out_degree()) > 20
+
+    np.random.seed(0)
+    X_init = (0.01 * np.random.randn(node_num, dim_emb)).astype(np.float32)
+    np.random.seed(0)
+    X_1 = np.copy(embedding.learn_embedding(graphs[0]))
+    assert np.all(np.isfinite(X_1))
+    X_1_ref = sequential_sgd(X_init, adj_1, eta, regu, kappa, 10)
+    assert np.isclose(embedding.getFVal(adj_1, X_1)[3], embedding.getFVal(adj_1, X_1_ref)[3], rtol=1e-3)
+
+    X_2 = embedding.learn_embedding(graphs[1], X_1)
+    assert np.all(np.isfinite(X_2))
+    X_2_ref = sequential_sgd(X_1, adj_2, eta, regu, kappa, 10, X_1)
+    assert np.isclose(embedding.getFVal(adj_2, X_2, X_1)[3], embedding.getFVal(adj_2, X_2_ref, X_1)[3],
+                      rtol=1e-3)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
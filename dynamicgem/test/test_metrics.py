@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This module is for testing the MAP metrics
+"""
+
+import random
+import numpy as np
+import networkx as nx
+from dynamicgem.evaluation import metrics
+
+
+def reference_MAP(predicted_edge_list, true_digraph, max_k=-1):
+    # Per-node average precision through computePrecisionCurve
+    node_num = true_digraph.number_of_nodes()
+    node_edges = [[] for _ in range(node_num)]
+    for (st, ed, w) in predicted_edge_list:
+        node_edges[st].append((st, ed, w))
+    node_AP = [0.0] * node_num
+    count = 0
+    for i in range(node_num):
+        if true_digraph.out_degree(i) == 0:
+            continue
+        count += 1
+        precision_scores, delta_factors = metrics.computePrecisionCurve(node_edges[i], true_digraph, max_k)
+        if sum(delta_factors) != 0:
+            node_AP[i] = sum(p * d for p, d in zip(precision_scores, delta_factors)) / sum(delta_factors)
+    return sum(node_AP) / count
+
+
+def reference_MAP_changed(predicted_edge_list, true_digraph, node_dict, edges_rm):
+    # Predicted edges ranked through computePrecisionCurve, followed by the
+    # removed edges that were not predicted
+    node_num = true_digraph.number_of_nodes()
+    node_edges = [[] for _ in range(node_num)]
+    for (st, ed, w) in predicted_edge_list:
+        node_edges[st].append((st, ed, w))
+    node_edges_rm = [[] for _ in range(node_num)]
+    for st, ed in edges_rm[0]:
+        node_edges_rm[node_dict[st]].append((node_dict[st], node_dict[ed]))
+    node_AP = [0.0] * node_num
+    count = 0
+    for i in range(node_num):
+        if true_digraph.out_degree(i) == 0:
+            continue
+        count += 1
+        precision_scores, delta_factors = metrics.computePrecisionCurve(node_edges[i], true_digraph)
+        correct_edge = sum(delta_factors)
+        for j, e in enumerate(node_edges_rm[i]):
+            if not any(k[0] == e[0] and k[1] == e[1] for k in node_edges[i]):
+                correct_edge += 1
+                delta_factors.append(1.0)
+            else:
+                delta_factors.append(0.0)
+            precision_scores.append(correct_edge / (len(node_edges[i]) + j + 1))
+        if sum(delta_factors) != 0:
+            node_AP[i] = sum(p * d for p, d in zip(precision_scores, delta_factors)) / sum(delta_factors)
+    return sum(node_AP) / count
+
+
+def random_predictions(node_num, rng):
+    # Weights rounded to one decimal so that many scores tie
+    return [(i, j, round(rng.random(), 1))
+            for i in range(node_num) for j in range(node_num)
+            if i != j and rng.random() < 0.5]
+
+
+def test_computeMAP():
+    rng = random.Random(0)
+    for trial in range(10):
+        node_num = 30
+        true_digraph = nx.gnp_random_graph(node_num, 0.15, seed=trial, directed=True)
+        predicted_edge_list = random_predictions(node_num, rng)
+        for max_k in [-1, 1, 3, 10]:
+            assert np.isclose(metrics.computeMAP(predicted_edge_list, true_digraph, max_k),
+                              reference_MAP(predicted_edge_list, true_digraph, max_k))
+
+
+def test_computeMAP_changed():
+    rng = random.Random(1)
+    for trial in range(10):
+        node_num = 30
+        true_digraph = nx.gnp_random_graph(node_num, 0.15, seed=trial, directed=True)
+        predicted_edge_list = random_predictions(node_num, rng)
+        node_dict = {i: i for i in range(node_num)}
+        edges_rm = [[(i, j) for i in range(node_num) for j in range(node_num)
+                     if i != j and rng.random() < 0.1]]
+        assert np.isclose(metrics.computeMAP_changed(predicted_edge_list, true_digraph, node_dict, edges_rm),
+                          reference_MAP_changed(predicted_edge_list, true_digraph, node_dict, edges_rm))
+
+
+if __name__ == '__main__':
+    test_computeMAP()
+    test_computeMAP_changed()
@@ -59,27 +59,31 @@ def model_batch_predictor_v2(model, X, batch_size):
         pdb.set_trace()
 
 
-def batch_generator_ae(X, beta, batch_size, shuffle):
-    number_of_batches = X.shape[0] // batch_size
+def batch_generator_ae(X_data, X_indices, X_indptr, beta, batch_size, shuffle):
+    # X_data, X_indices, X_indptr are the arrays of a square CSR adjacency
+    # matrix without explicit zeros. Batches are scattered straight from them,
+    # along with the penalty matrix B (beta on observed entries, -2 elsewhere).
+    n = X_indptr.shape[0] - 1
+    number_of_batches = n // batch_size
     counter = 0
-    sample_index = np.arange(X.shape[0])
+    sample_index = np.arange(n)
     if shuffle:
         np.random.shuffle(sample_index)
     while True:
         batch_index = \
             sample_index[batch_size * counter:batch_size * (counter + 1)]
-        X_batch = X[batch_index, :].toarray()
-        y_batch = np.ones(X_batch.shape)
-        # y_batch = beta * np.ones(X_batch.shape)
-        # for idx in range(X_batch.shape[0]):
-        #     for idx2 in range(X_batch.shape[1]):
-        #         if X_batch[idx, idx2] == 0:
-        #             y_batch[idx, idx2] = np.random.choice([0, 1], p=[0.9, 0.1])
-        y_batch[X_batch != 0] = beta  # np.random.choice([0, 1], p=[0.9, 0.1])
-        y_batch[X_batch == 0] = -2
-        # y_batch[X_batch == 0] = 0#np.random.choice([0, 1], p=[0.9, 0.1])
+        starts = X_indptr[batch_index]
+        lengths = X_indptr[batch_index + 1] - starts
+        batch_rows = np.repeat(np.arange(batch_index.shape[0]), lengths)
+        pos = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        batch_cols = X_indices[pos]
+        X_batch = np.zeros((batch_index.shape[0], n), dtype=X_data.dtype)
+        X_batch[batch_rows, batch_cols] = X_data[pos]
+        B_batch = np.full(X_batch.shape, -2, dtype=np.float32)
+        B_batch[batch_rows, batch_cols] = beta
         counter += 1
-        yield X_batch, y_batch
+        # B is a model input; the AE loss is attached with add_loss
+        yield [X_batch, B_batch], None
         if counter == number_of_batches:
             if shuffle:
                 np.random.shuffle(sample_index)